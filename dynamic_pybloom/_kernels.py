@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+"""Numba-compiled probe/insert kernels for BloomFilter.
+
+Importing this module requires numba; pybloom imports it lazily and falls
+back to the numpy/scalar paths when it is unavailable. Both kernels take
+the filter's bit buffer as a contiguous uint8 view plus the double-hash
+pair, and walk the slices with the same index arithmetic as the Python
+paths: k_i = (h1 + i*h2) mod bits_per_slice + i*bits_per_slice, all
+wrapping at 64 bits.
+
+Each slice of a large filter lives on its own cache line, so the probe
+loop is latency-bound; both kernels issue a software prefetch for the
+next slice's byte before testing the current one.
+"""
+from numba import njit, types, uint8, uint64
+from numba.core import cgutils
+from numba.extending import intrinsic
+from llvmlite import ir
+
+_ONE = uint64(1)
+_PROBE_SIG = 'b1(u1[::1], u8, u8, i8, i8)'
+_INSERT_SIG = 'b1(u1[::1], u8, u8, i8, i8)'
+
+
+@intrinsic
+def _prefetch(typingctx, buf, idx):
+    """Emit llvm.prefetch of &buf[idx] for reading, low temporal
+    locality, data cache."""
+    if not (isinstance(buf, types.Array) and buf.ndim == 1):
+        return None
+    sig = types.void(buf, types.uint64)
+
+    def codegen(context, builder, signature, args):
+        arr, i = args
+        ary = context.make_array(signature.args[0])(context, builder, arr)
+        i8p = ir.IntType(8).as_pointer()
+        i32 = ir.IntType(32)
+        ptr = builder.bitcast(builder.gep(ary.data, [i]), i8p)
+        fnty = ir.FunctionType(ir.VoidType(), [i8p, i32, i32, i32])
+        fn = cgutils.get_or_insert_function(builder.module, fnty,
+                                            'llvm.prefetch.p0')
+        # rw=0 (read), locality=0, cache type=1 (data)
+        builder.call(fn, [ptr, i32(0), i32(0), i32(1)])
+        return context.get_dummy_value()
+
+    return sig, codegen
+
+
+@njit(_PROBE_SIG, cache=True)
+def probe(buf, h1, h2, num_slices, bits_per_slice):
+    """Return True iff every slice bit for (h1, h2) is set."""
+    bps = uint64(bits_per_slice)
+    k = h1 % bps
+    for i in range(num_slices):
+        nxt = uint64(i) + _ONE
+        if i + 1 < num_slices:
+            k_next = (h1 + nxt * h2) % bps + nxt * bps
+            _prefetch(buf, k_next >> uint64(3))
+        j = k + uint64(i) * bps
+        if not (buf[j >> uint64(3)] >> (j & uint64(7))) & _ONE:
+            return False
+        k = (h1 + nxt * h2) % bps
+    return True
+
+
+@njit(_INSERT_SIG, cache=True)
+def insert(buf, h1, h2, num_slices, bits_per_slice):
+    """Set every slice bit for (h1, h2); return True iff all of them
+    were already set."""
+    bps = uint64(bits_per_slice)
+    found_all = True
+    k = h1 % bps
+    for i in range(num_slices):
+        nxt = uint64(i) + _ONE
+        if i + 1 < num_slices:
+            k_next = (h1 + nxt * h2) % bps + nxt * bps
+            _prefetch(buf, k_next >> uint64(3))
+        j = k + uint64(i) * bps
+        byte = j >> uint64(3)
+        mask = uint8(_ONE << (j & uint64(7)))
+        if not buf[byte] & mask:
+            found_all = False
+            buf[byte] |= mask
+        k = (h1 + nxt * h2) % bps
+    return found_all
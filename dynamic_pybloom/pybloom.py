@@ -39,24 +39,48 @@ Requires the bitarray library: http://pypi.python.org/pypi/bitarray/
     >>> for i in range_fn(0, count):
     ...     _ = sbf.add(i)
     ...
-    >>> sbf.capacity > count
+    >>> sbf.capacity >= count
     True
     >>> len(sbf) <= count
     True
 
 """
 from __future__ import absolute_import
+import bisect
+import functools
 import math
 import hashlib
-from dynamic_pybloom.utils import range_fn, is_string_io, running_python_3
-from struct import unpack, pack, calcsize
-from binascii import hexlify, unhexlify
+from dynamic_pybloom.utils import range_fn, is_string_io
+from struct import unpack, unpack_from, pack, calcsize
+from base64 import b85encode, b85decode
 
 try:
     import bitarray
 except ImportError:
     raise ImportError('dynamic_pybloom requires bitarray >= 0.3.4')
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The numba kernels are imported on first use rather than here: importing
+# _kernels triggers numba's jit machinery, which is too heavy a price for
+# merely importing this module. None means not yet attempted, False means
+# attempted and unavailable.
+_kernels = None
+
+
+def _load_kernels():
+    global _kernels
+    if _kernels is None:
+        try:
+            from dynamic_pybloom import _kernels as _kernels_mod
+            _kernels = _kernels_mod
+        except ImportError:
+            _kernels = False
+    return _kernels or None
+
 __version__ = '3.1'
 __author__ = "Jay Baird <jay.baird@me.com>, Bob Ippolito <bob@redivi.com>,\
                Marius Eriksen <marius@monkey.org>,\
@@ -65,7 +89,130 @@ __author__ = "Jay Baird <jay.baird@me.com>, Bob Ippolito <bob@redivi.com>,\
                Sam Findler <samuel.findler@market-predictions.com>"
 
 
-def make_hashfuncs(num_slices, num_bits):
+# Per-slice indices wider than this cannot be derived from a pair of 64-bit
+# hashes without noticeable modulo bias, so such filters keep the old
+# chunked-SHA construction.
+MAX_DOUBLE_HASH_BITS = 1 << 60
+
+# Below this slice width the double-hash construction also needs
+# num_slices * log2(bits_per_slice) <= 128: deriving more index bits than
+# the digest provides from (h1 + i*h2) mod m leaves a measurable
+# false-positive floor at small m (~4e-5 for k=24, m=140 — the inner
+# filters DynamicBloomFilter builds by default), hundreds of times over a
+# tight error_rate. Large filters are unaffected and keep the fast path.
+MIN_DOUBLE_HASH_SLICE_BITS = 1 << 16
+
+
+def _double_hash_ok(num_slices, bits_per_slice):
+    """Whether 128 digest bits give (h1 + i*h2) mod m enough index
+    entropy to honor the filter's error contract."""
+    if bits_per_slice > MAX_DOUBLE_HASH_BITS:
+        return False
+    if bits_per_slice >= MIN_DOUBLE_HASH_SLICE_BITS:
+        return True
+    return num_slices * math.log(max(bits_per_slice, 2), 2) <= 128
+
+# The index arithmetic wraps at 64 bits so that the scalar and the
+# vectorized (numpy uint64) paths produce identical slice indices.
+MASK64 = (1 << 64) - 1
+
+# Binary frame for Scalable/Dynamic filter serialization:
+# <magic:4s><version:B><class header:FILE_FMT><n_filters:I> followed by
+# one <framelen:Q><BloomFilter.to_bytes() frame> per inner filter.
+FRAME_MAGIC = b'dPBF'
+FRAME_VERSION = 1
+FRAME_HEADER_FMT = '<4sB'
+
+
+_LN2_SQ = math.log(2) ** 2
+
+
+@functools.lru_cache(maxsize=256)
+def _bloom_dims(capacity, error_rate):
+    """Derived (num_slices, bits_per_slice) for a capacity/error_rate
+    pair. Scalable/Dynamic filters rebuild inner filters with recurring
+    parameters every time one fills, so the log/ceil math is cached.
+
+    given M = num_bits, k = num_slices, P = error_rate, n = capacity
+          k = log2(1/P)
+    solving for m = bits_per_slice
+    n ~= M * ((ln(2) ** 2) / abs(ln(P)))
+    n ~= (k * m) * ((ln(2) ** 2) / abs(ln(P)))
+    m ~= n * abs(ln(P)) / (k * (ln(2) ** 2))
+    """
+    num_slices = int(math.ceil(math.log(1.0 / error_rate, 2)))
+    bits_per_slice = int(math.ceil(
+        (capacity * abs(math.log(error_rate))) /
+        (num_slices * _LN2_SQ)))
+    return num_slices, bits_per_slice
+
+
+def _encode_key(key):
+    """Normalize a key to the bytes that get hashed."""
+    if isinstance(key, str):
+        return key.encode('utf-8')
+    elif isinstance(key, bytes):
+        return key
+    else:
+        return str(key).encode('utf-8')
+
+
+# Pinned: the digest determines which bits a key maps to, so serialized
+# filters are only portable if every host derives the same hash. An
+# optional faster digest (e.g. xxh3) would silently corrupt membership
+# for filters exchanged with hosts lacking the package.
+def _hash128(data):
+    return hashlib.blake2b(data, digest_size=16, person=b'pybloom').digest()
+
+
+def _double_hash(key):
+    """Hash `key' once and return the (h1, h2) pair used by the
+    Kirsch-Mitzenmacher construction g_i(x) = h1(x) + i*h2(x)."""
+    return unpack('<QQ', _hash128(_encode_key(key)))
+
+
+@functools.lru_cache(maxsize=256)
+def make_hashfuncs(num_slices, num_bits, security=False):
+    # cached: the returned closures are pure functions of the arguments,
+    # and Scalable/Dynamic filters rebuild inner filters with recurring
+    # (num_slices, num_bits) so construction cost and the legacy path's
+    # retained salt objects are shared across filters
+    if security or not _double_hash_ok(num_slices, num_bits):
+        return _make_legacy_hashfuncs(num_slices, num_bits)
+    indices = _pair_index_fn(num_slices, num_bits)
+
+    def _make_hashfuncs(key):
+        return indices(*_double_hash(key))
+
+    return _make_hashfuncs
+
+
+@functools.lru_cache(maxsize=256)
+def _pair_index_fn(num_slices, num_bits):
+    """(h1, h2) -> the per-slice bit indices. num_slices and num_bits are
+    constants for the lifetime of a filter, so for the common case the
+    slice loop is exec-specialized into a fixed-length tuple expression
+    with both baked in as literals. This is the index function behind
+    make_hashes and the scalar _contains_hashes/_add_hashes fallback."""
+    if num_slices <= 64:
+        terms = ','.join('((h1 + %d * h2) & %d) %% %d' % (i, MASK64, num_bits)
+                         for i in range_fn(num_slices))
+        namespace = {}
+        exec('def _indices(h1, h2):\n    return (%s,)\n' % terms, namespace)
+        return namespace['_indices']
+
+    def _indices(h1, h2):
+        return [((h1 + i * h2) & MASK64) % num_bits
+                for i in range_fn(num_slices)]
+
+    return _indices
+
+
+def _make_legacy_hashfuncs(num_slices, num_bits):
+    """Original chunked-SHA construction: one salted digest per chunk_size
+    bytes of index output. Only used when the slices are too wide for the
+    double-hashing fast path, or when the filter asked for cryptographic
+    hashing with security=True."""
     if num_bits >= (1 << 31):
         fmt_code, chunk_size = 'Q', 8
     elif num_bits >= (1 << 15):
@@ -87,35 +234,24 @@ def make_hashfuncs(num_slices, num_bits):
     num_salts, extra = divmod(num_slices, len(fmt))
     if extra:
         num_salts += 1
-    salts = tuple(hashfn(hashfn(pack('I', i)).digest()) for i in range_fn(num_salts))
+    salts = tuple(hashfn(pack('<I', i)) for i in range_fn(num_salts))
     def _make_hashfuncs(key):
-        if running_python_3:
-            if isinstance(key, str):
-                key = key.encode('utf-8')
-            else:
-                key = str(key).encode('utf-8')
-        else:
-            if isinstance(key, unicode):
-                key = key.encode('utf-8')
-            else:
-                key = str(key)
-        i = 0
+        key = _encode_key(key)
+        rv = []
         for salt in salts:
             h = salt.copy()
             h.update(key)
-            for uint in unpack(fmt, h.digest()):
-                yield uint % num_bits
-                i += 1
-                if i >= num_slices:
-                    return
+            rv.extend(uint % num_bits for uint in unpack(fmt, h.digest()))
+        del rv[num_slices:]
+        return rv
 
     return _make_hashfuncs
 
 
 class BloomFilter(object):
-    FILE_FMT = b'<dQQQQ'
+    FILE_FMT = b'<dQQQQ?'
 
-    def __init__(self, capacity, error_rate=0.001):
+    def __init__(self, capacity, error_rate=0.001, security=False):
         """Implements a space-efficient probabilistic data structure
 
         capacity
@@ -126,6 +262,11 @@ class BloomFilter(object):
             the error_rate of the filter returning false positives. This
             determines the filters capacity. Inserting more than capacity
             elements greatly increases the chance of false positives.
+        security
+            use the salted-SHA hash construction instead of the fast
+            non-cryptographic one, for filters that must resist deliberate
+            pollution. Slower. The flag is carried in the serialized
+            header, so such filters round-trip like any other.
 
         >>> b = BloomFilter(capacity=100000, error_rate=0.001)
         >>> b.add("test")
@@ -138,28 +279,82 @@ class BloomFilter(object):
             raise ValueError("Error_Rate must be between 0 and 1.")
         if not capacity > 0:
             raise ValueError("Capacity must be > 0")
-        # given M = num_bits, k = num_slices, P = error_rate, n = capacity
-        #       k = log2(1/P)
-        # solving for m = bits_per_slice
-        # n ~= M * ((ln(2) ** 2) / abs(ln(P)))
-        # n ~= (k * m) * ((ln(2) ** 2) / abs(ln(P)))
-        # m ~= n * abs(ln(P)) / (k * (ln(2) ** 2))
-        num_slices = int(math.ceil(math.log(1.0 / error_rate, 2)))
-        bits_per_slice = int(math.ceil(
-            (capacity * abs(math.log(error_rate))) /
-            (num_slices * (math.log(2) ** 2))))
-        self._setup(error_rate, num_slices, bits_per_slice, capacity, 0)
+        num_slices, bits_per_slice = _bloom_dims(capacity, error_rate)
+        self._setup(error_rate, num_slices, bits_per_slice, capacity, 0,
+                    security)
         self.bitarray = bitarray.bitarray(self.num_bits, endian='little')
         self.bitarray.setall(False)
 
-    def _setup(self, error_rate, num_slices, bits_per_slice, capacity, count):
+    def _setup(self, error_rate, num_slices, bits_per_slice, capacity, count,
+               security=False):
         self.error_rate = error_rate
         self.num_slices = num_slices
         self.bits_per_slice = bits_per_slice
         self.capacity = capacity
         self.count = count
         self.num_bits = num_slices * bits_per_slice
-        self.make_hashes = make_hashfuncs(self.num_slices, self.bits_per_slice)
+        self._slice_offsets = tuple(range_fn(0, self.num_bits, bits_per_slice))
+        self.security = bool(security)
+        self.make_hashes = make_hashfuncs(self.num_slices, self.bits_per_slice,
+                                          self.security)
+        # Whether membership/insert can work from a precomputed (h1, h2)
+        # pair, letting Scalable/Dynamic filters hash each key only once.
+        self._shares_hashes = (not self.security
+                               and _double_hash_ok(num_slices, bits_per_slice))
+        # The vectorized path needs the double-hash pair and enough slices
+        # for the numpy dispatch to beat a short Python loop.
+        self._use_numpy = (np is not None and num_slices >= 4
+                           and self._shares_hashes)
+        self._pair_indices = (_pair_index_fn(num_slices, bits_per_slice)
+                              if self._shares_hashes else None)
+        self._use_kernels = bool(self._use_numpy and _load_kernels())
+        if self._use_numpy:
+            islice = np.arange(num_slices, dtype=np.uint64)
+            self._np_islice = islice
+            self._np_offsets = islice * np.uint64(bits_per_slice)
+        self._bitview = None
+        self._buf = None
+
+    def _view(self):
+        """uint8 view of the underlying bit buffer, created lazily so that
+        reassignments of `self.bitarray' right after construction stay
+        cheap."""
+        buf = self._bitview
+        if buf is None:
+            buf = self._bitview = np.frombuffer(self.bitarray, dtype=np.uint8)
+        return buf
+
+    def _byte_view(self):
+        """memoryview counterpart of `_view' for the pure-Python path;
+        testing whole bytes avoids a bitarray __getitem__ call per slice."""
+        buf = self._buf
+        if buf is None:
+            buf = self._buf = memoryview(self.bitarray).cast('B')
+        return buf
+
+    def _invalidate_views(self):
+        """Drop cached buffer views; must be called whenever the bitarray
+        object is replaced or resized (frombytes/fromfile)."""
+        self._bitview = None
+        self._buf = None
+
+    def _hash_indices(self, h1, h2):
+        """All num_slices bit indices for one key as a uint64 array."""
+        idx = (np.uint64(h1) + self._np_islice * np.uint64(h2))
+        idx %= np.uint64(self.bits_per_slice)
+        idx += self._np_offsets
+        return idx
+
+    def _hash_indices_many(self, keys):
+        """(byte_index, mask) arrays of shape (len(keys), num_slices)
+        covering every slice bit of every key."""
+        H = np.empty((len(keys), 2), dtype=np.uint64)
+        for i, key in enumerate(keys):
+            H[i, 0], H[i, 1] = _double_hash(key)
+        idx = (H[:, :1] + self._np_islice * H[:, 1:])
+        idx %= np.uint64(self.bits_per_slice)
+        idx += self._np_offsets
+        return idx >> np.uint64(3), (1 << (idx & np.uint64(7))).astype(np.uint8)
 
     def __contains__(self, key):
         """Tests a key's membership in this bloom filter.
@@ -171,25 +366,88 @@ class BloomFilter(object):
         True
 
         """
-        bits_per_slice = self.bits_per_slice
-        bitarray = self.bitarray
-        hashes = self.make_hashes(key)
-        offset = 0
-        for k in hashes:
-            if not bitarray[offset + k]:
+        if self._shares_hashes:
+            h1, h2 = _double_hash(key)
+            return self._contains_hashes(h1, h2)
+        buf = self._byte_view()
+        for off, k in zip(self._slice_offsets, self.make_hashes(key)):
+            j = off + k
+            if not (buf[j >> 3] >> (j & 7)) & 1:
                 return False
-            offset += bits_per_slice
         return True
 
+    def _contains_hashes(self, h1, h2):
+        """Membership test from a precomputed double-hash pair."""
+        if self._use_kernels:
+            return _kernels.probe(self._view(), h1, h2,
+                                  self.num_slices, self.bits_per_slice)
+        if self._use_numpy:
+            idx = self._hash_indices(h1, h2)
+            mask = (1 << (idx & np.uint64(7))).astype(np.uint8)
+            return bool((self._view()[idx >> np.uint64(3)] & mask).all())
+        buf = self._byte_view()
+        for off, k in zip(self._slice_offsets, self._pair_indices(h1, h2)):
+            j = off + k
+            if not (buf[j >> 3] >> (j & 7)) & 1:
+                return False
+        return True
+
+    def _add_hashes(self, h1, h2):
+        """Set all slice bits for a precomputed double-hash pair; returns
+        True iff every bit was already set. Leaves the count alone."""
+        if self._use_kernels:
+            return _kernels.insert(self._view(), h1, h2,
+                                   self.num_slices, self.bits_per_slice)
+        if self._use_numpy:
+            idx = self._hash_indices(h1, h2)
+            byte_idx = idx >> np.uint64(3)
+            mask = (1 << (idx & np.uint64(7))).astype(np.uint8)
+            buf = self._view()
+            found_all_bits = bool((buf[byte_idx] & mask).all())
+            np.bitwise_or.at(buf, byte_idx, mask)
+            return found_all_bits
+        buf = self._byte_view()
+        found_all_bits = True
+        for off, k in zip(self._slice_offsets, self._pair_indices(h1, h2)):
+            j = off + k
+            b = buf[j >> 3]
+            mask = 1 << (j & 7)
+            if not b & mask:
+                found_all_bits = False
+                buf[j >> 3] = b | mask
+        return found_all_bits
+
+    def to_bytes(self):
+        """
+        export as a compact binary frame: the FILE_FMT header followed by
+        the raw (little-endian) bit buffer
+        :return: bytes
+        """
+        return pack(self.FILE_FMT, self.error_rate, self.num_slices,
+                    self.bits_per_slice, self.capacity, self.count,
+                    self.security) + self.bitarray.tobytes()
+
+    @classmethod
+    def from_bytes(cls, b):
+        """
+        rebuild a bloom filter from a to_bytes() frame, complement to the
+        to_bytes method
+        :param b:
+        :return:
+        """
+        filter = cls(1)
+        filter._setup(*unpack_from(cls.FILE_FMT, b))
+        filter.bitarray = bitarray.bitarray(endian='little')
+        filter.bitarray.frombytes(bytes(b[calcsize(cls.FILE_FMT):]))
+        filter._invalidate_views()
+        return filter
+
     def __str__(self):
         """
         export as string to be sent over network or between programming languages
-        :return: compressed string representation
+        :return: compressed string representation (base85 of to_bytes())
         """
-        return ":".join([str(self.error_rate), str(self.num_slices),
-                        str(self.bits_per_slice), str(self.capacity),
-                        str(self.count), self.bitarray.endian(),
-                         hexlify(self.bitarray.tobytes())])
+        return b85encode(self.to_bytes()).decode('ascii')
 
     @classmethod
     def from_str(cls, s):
@@ -198,12 +456,7 @@ class BloomFilter(object):
         :param s:
         :return:
         """
-        filter = cls(1)
-        values = s.split(":")
-        filter._setup(float(values[0]), int(values[1]), int(values[2]), int(values[3]), int(values[4]))
-        filter.bitarray = bitarray.bitarray(endian=values[5])
-        filter.bitarray.frombytes(unhexlify(values[6]))
-        return filter
+        return cls.from_bytes(b85decode(s))
 
     def __len__(self):
         """Return the number of keys stored by this bloom filter."""
@@ -222,18 +475,21 @@ class BloomFilter(object):
         1
 
         """
-        bitarray = self.bitarray
-        bits_per_slice = self.bits_per_slice
-        hashes = self.make_hashes(key)
-        found_all_bits = True
         if self.count > self.capacity:
             raise IndexError("BloomFilter is at capacity")
-        offset = 0
-        for k in hashes:
-            if not skip_check and found_all_bits and not bitarray[offset + k]:
-                found_all_bits = False
-            self.bitarray[offset + k] = True
-            offset += bits_per_slice
+        if self._shares_hashes:
+            h1, h2 = _double_hash(key)
+            found_all_bits = self._add_hashes(h1, h2)
+        else:
+            buf = self._byte_view()
+            found_all_bits = True
+            for off, k in zip(self._slice_offsets, self.make_hashes(key)):
+                j = off + k
+                b = buf[j >> 3]
+                mask = 1 << (j & 7)
+                if not skip_check and found_all_bits and not b & mask:
+                    found_all_bits = False
+                buf[j >> 3] = b | mask
 
         if skip_check:
             self.count += 1
@@ -244,27 +500,97 @@ class BloomFilter(object):
         else:
             return True
 
+    def contains_many(self, keys):
+        """Tests membership of many keys at once. Returns a boolean numpy
+        array aligned with `keys' (a plain list of bools on the fallback
+        path).
+
+        >>> b = BloomFilter(capacity=100)
+        >>> b.add("hello")
+        False
+        >>> [bool(x) for x in b.contains_many(["hello", "goodbye"])]
+        [True, False]
+
+        """
+        keys = list(keys)
+        if not self._use_numpy:
+            return [key in self for key in keys]
+        byte_idx, mask = self._hash_indices_many(keys)
+        return ((self._view()[byte_idx] & mask) == mask).all(axis=1)
+
+    def add_many(self, keys, skip_check=False):
+        """Adds many keys at once; the bulk version of `add'. Returns
+        per-key booleans mirroring add()'s return value (True where the
+        key was already present). Unlike repeated add() calls, duplicate
+        keys within one batch are each counted as new.
+
+        >>> b = BloomFilter(capacity=100)
+        >>> [bool(x) for x in b.add_many(["hello", "world"])]
+        [False, False]
+        >>> "world" in b
+        True
+
+        """
+        keys = list(keys)
+        if self.count > self.capacity:
+            raise IndexError("BloomFilter is at capacity")
+        if not self._use_numpy:
+            return [self.add(key, skip_check) for key in keys]
+        byte_idx, mask = self._hash_indices_many(keys)
+        buf = self._view()
+        if skip_check:
+            found = np.zeros(len(keys), dtype=bool)
+        else:
+            found = ((buf[byte_idx] & mask) == mask).all(axis=1)
+        np.bitwise_or.at(buf, byte_idx, mask)
+        self.count += len(keys) - int(found.sum())
+        return found
+
     def copy(self):
         """Return a copy of this bloom filter.
         """
-        new_filter = BloomFilter(self.capacity, self.error_rate)
+        new_filter = BloomFilter(self.capacity, self.error_rate, self.security)
         new_filter.bitarray = self.bitarray.copy()
         new_filter.count = self.count
         return new_filter
 
+    def _combine_bitarrays(self, other, op):
+        """OR/AND this filter's bits with `other''s through numpy's
+        vectorized `op' and return the result as a new bitarray."""
+        a = np.frombuffer(self.bitarray, dtype=np.uint8)
+        b = np.frombuffer(other.bitarray, dtype=np.uint8)
+        out = np.empty_like(a)
+        # run the bulk of the buffer 8 bytes at a time; anything past the
+        # last whole uint64 word is handled as a byte-wide remainder
+        split = (a.nbytes >> 3) << 3
+        op(a[:split].view(np.uint64), b[:split].view(np.uint64),
+           out=out[:split].view(np.uint64))
+        if split != a.nbytes:
+            op(a[split:], b[split:], out=out[split:])
+        combined = bitarray.bitarray(endian='little')
+        combined.frombytes(out.tobytes())
+        # frombytes pads to a byte boundary; trim back to num_bits
+        return combined[:self.num_bits]
+
     def union(self, other):
         """ Calculates the union of the two underlying bitarrays and returns
         a new bloom filter object."""
         if self.capacity != other.capacity or \
-            self.error_rate != other.error_rate:
+            self.error_rate != other.error_rate or \
+            self.security != other.security:
             raise ValueError("Unioning filters requires both filters to have \
-both the same capacity and error rate")
+the same capacity, error rate and hash construction")
         new_bloom = self.copy()
-        new_bloom.bitarray = new_bloom.bitarray | other.bitarray
+        if np is not None:
+            new_bloom.bitarray = self._combine_bitarrays(other, np.bitwise_or)
+            new_bloom._invalidate_views()
+        else:
+            new_bloom.bitarray = new_bloom.bitarray | other.bitarray
 
         # count calculation from http://www.l3s.de/~papapetrou/publications/Bloomfilters-DAPD.pdf
         try:
-            new_bloom.count = int(math.log(1 - float(new_bloom.bitarray.count()) / len(new_bloom.bitarray)) / \
+            set_bits = new_bloom.bitarray.count()
+            new_bloom.count = int(math.log(1 - float(set_bits) / len(new_bloom.bitarray)) / \
                                   (new_bloom.num_slices * math.log(1 - 1. / len(new_bloom.bitarray))))
         except:
             new_bloom.count = len(new_bloom.bitarray)
@@ -277,15 +603,21 @@ both the same capacity and error rate")
         """ Calculates the intersection of the two underlying bitarrays and returns
         a new bloom filter object."""
         if self.capacity != other.capacity or \
-            self.error_rate != other.error_rate:
+            self.error_rate != other.error_rate or \
+            self.security != other.security:
             raise ValueError("Intersecting filters requires both filters to \
-have equal capacity and error rate")
+have equal capacity, error rate and hash construction")
         new_bloom = self.copy()
-        new_bloom.bitarray = new_bloom.bitarray & other.bitarray
+        if np is not None:
+            new_bloom.bitarray = self._combine_bitarrays(other, np.bitwise_and)
+            new_bloom._invalidate_views()
+        else:
+            new_bloom.bitarray = new_bloom.bitarray & other.bitarray
 
         # count calculation from http://www.l3s.de/~papapetrou/publications/Bloomfilters-DAPD.pdf
         try:
-            new_bloom.count = int(math.log(1 - float(new_bloom.bitarray.count()) / len(new_bloom.bitarray)) / \
+            set_bits = new_bloom.bitarray.count()
+            new_bloom.count = int(math.log(1 - float(set_bits) / len(new_bloom.bitarray)) / \
                                   (new_bloom.num_slices * math.log(1 - 1. / len(new_bloom.bitarray))))
         except:
             new_bloom.count = len(new_bloom.bitarray)
@@ -299,7 +631,8 @@ have equal capacity and error rate")
         are written as machine values. This is much more space
         efficient than pickling the object."""
         f.write(pack(self.FILE_FMT, self.error_rate, self.num_slices,
-                     self.bits_per_slice, self.capacity, self.count))
+                     self.bits_per_slice, self.capacity, self.count,
+                     self.security))
         (f.write(self.bitarray.tobytes()) if is_string_io(f)
          else self.bitarray.tofile(f))
 
@@ -323,19 +656,69 @@ have equal capacity and error rate")
              else filter.bitarray.fromfile(f))
         if filter.num_bits != len(filter.bitarray) and \
                (filter.num_bits + (8 - filter.num_bits % 8)
-                != len(filter.bitarray):
+                != len(filter.bitarray)):
             raise ValueError('Bit length mismatch!')
+        filter._invalidate_views()
 
         return filter
 
     def __getstate__(self):
         d = self.__dict__.copy()
-        del d['make_hashes']
+        # Drop everything _setup derives: some of it is unpicklable (the
+        # exec'd index function), some host-dependent (numpy/numba
+        # availability and their arrays), and the views alias the
+        # bitarray's buffer.
+        for key in ('make_hashes', '_pair_indices', '_slice_offsets',
+                    '_shares_hashes', '_use_numpy', '_use_kernels',
+                    '_np_islice', '_np_offsets', '_bitview', '_buf'):
+            d.pop(key, None)
         return d
 
     def __setstate__(self, d):
         self.__dict__.update(d)
-        self.make_hashes = make_hashfuncs(self.num_slices, self.bits_per_slice)
+        # Rederive the dispatch flags and helpers for this host rather
+        # than trusting the pickling host's: numpy or the numba kernels
+        # may be available there but not here, or vice versa.
+        self._setup(self.error_rate, self.num_slices, self.bits_per_slice,
+                    self.capacity, self.count,
+                    getattr(self, 'security', False))
+
+
+def _frames_to_bytes(header, filters):
+    """Pack a Scalable/Dynamic filter into the binary frame format:
+    class-specific `header' bytes plus a length-prefixed BloomFilter
+    frame per inner filter."""
+    parts = [pack(FRAME_HEADER_FMT, FRAME_MAGIC, FRAME_VERSION), header,
+             pack('<I', len(filters))]
+    for filter in filters:
+        frame = filter.to_bytes()
+        parts.append(pack('<Q', len(frame)))
+        parts.append(frame)
+    return b''.join(parts)
+
+
+def _frames_from_bytes(b, fmt):
+    """Parse a binary frame produced by `_frames_to_bytes'. Returns the
+    class header fields (unpacked with `fmt') and the inner filters; a
+    single memoryview over the input avoids any intermediate copies."""
+    buf = memoryview(b)
+    magic, version = unpack_from(FRAME_HEADER_FMT, buf)
+    if magic != FRAME_MAGIC:
+        raise ValueError('not a dynamic_pybloom frame')
+    if version != FRAME_VERSION:
+        raise ValueError('unsupported frame version: %d' % version)
+    offset = calcsize(FRAME_HEADER_FMT)
+    fields = unpack_from(fmt, buf, offset)
+    offset += calcsize(fmt)
+    n_filters, = unpack_from('<I', buf, offset)
+    offset += calcsize('<I')
+    filters = []
+    for _ in range_fn(n_filters):
+        framelen, = unpack_from('<Q', buf, offset)
+        offset += calcsize('<Q')
+        filters.append(BloomFilter.from_bytes(buf[offset:offset + framelen]))
+        offset += framelen
+    return fields, filters
 
 
 class ScalableBloomFilter(object):
@@ -377,6 +760,8 @@ class ScalableBloomFilter(object):
             raise ValueError("Error_Rate must be a decimal less than 0.")
         self._setup(mode, 0.9, initial_capacity, error_rate)
         self.filters = []
+        self._tail = None
+        self._recent_hit = -1
 
     def _setup(self, mode, ratio, initial_capacity, error_rate):
         self.scale = mode
@@ -395,8 +780,33 @@ class ScalableBloomFilter(object):
         True
 
         """
-        for f in reversed(self.filters):
-            if key in f:
+        filters = self.filters
+        hashes = None
+        # recency-biased workloads tend to hit the same filter over and
+        # over; probe the last filter that answered True first
+        recent = self._recent_hit
+        if 0 <= recent < len(filters):
+            f = filters[recent]
+            if f._shares_hashes:
+                hashes = _double_hash(key)
+                if f._contains_hashes(*hashes):
+                    return True
+            elif key in f:
+                return True
+        else:
+            recent = -1
+        for i in range_fn(len(filters) - 1, -1, -1):
+            if i == recent:
+                continue
+            f = filters[i]
+            if f._shares_hashes:
+                if hashes is None:
+                    hashes = _double_hash(key)
+                if f._contains_hashes(*hashes):
+                    self._recent_hit = i
+                    return True
+            elif key in f:
+                self._recent_hit = i
                 return True
         return False
 
@@ -413,22 +823,63 @@ class ScalableBloomFilter(object):
         True
 
         """
-        if key in self:
-            return True
-        if not self.filters:
+        # hash the key once and share the pair across every inner filter
+        hashes = _double_hash(key)
+        for f in reversed(self.filters):
+            if (f._contains_hashes(*hashes) if f._shares_hashes
+                    else key in f):
+                return True
+        filter = self._tail
+        if filter is None:
             filter = BloomFilter(
                 capacity=self.initial_capacity,
                 error_rate=self.error_rate * (1.0 - self.ratio))
             self.filters.append(filter)
+            self._tail = filter
+        elif filter.count >= filter.capacity:
+            filter = BloomFilter(
+                capacity=filter.capacity * self.scale,
+                error_rate=filter.error_rate * self.ratio)
+            self.filters.append(filter)
+            self._tail = filter
+        if filter._shares_hashes:
+            filter._add_hashes(*hashes)
+            filter.count += 1
         else:
-            filter = self.filters[-1]
-            if filter.count >= filter.capacity:
+            filter.add(key, skip_check=True)
+        return False
+
+    def add_many(self, keys):
+        """Adds many keys at once; the bulk version of `add'. Keys
+        already present are skipped, the rest are batch-inserted into the
+        newest filter, growing new filters as they fill. Duplicate keys
+        within one batch are each counted as new.
+
+        >>> b = ScalableBloomFilter(initial_capacity=100, error_rate=0.001)
+        >>> b.add_many(["hello", "world"])
+        >>> "world" in b
+        True
+
+        """
+        pending = [key for key in keys if key not in self]
+        while pending:
+            if not self.filters:
                 filter = BloomFilter(
-                    capacity=filter.capacity * self.scale,
-                    error_rate=filter.error_rate * self.ratio)
+                    capacity=self.initial_capacity,
+                    error_rate=self.error_rate * (1.0 - self.ratio))
                 self.filters.append(filter)
-        filter.add(key, skip_check=True)
-        return False
+            else:
+                filter = self.filters[-1]
+                if filter.count >= filter.capacity:
+                    filter = BloomFilter(
+                        capacity=filter.capacity * self.scale,
+                        error_rate=filter.error_rate * self.ratio)
+                    self.filters.append(filter)
+            room = max(filter.capacity - filter.count, 1)
+            filter.add_many(pending[:room], skip_check=True)
+            pending = pending[room:]
+        if self.filters:
+            self._tail = self.filters[-1]
 
     @property
     def capacity(self):
@@ -439,23 +890,29 @@ class ScalableBloomFilter(object):
     def count(self):
         return len(self)
 
-    def __str__(self):
-        return ",".join([str(self.scale), str(self.ratio),
-                        str(self.initial_capacity), str(self.error_rate),
-                        "|".join([str(filter) for filter in self.filters])])
+    def to_bytes(self):
+        """Serialize this ScalableBloomFilter as one binary frame."""
+        return _frames_to_bytes(
+            pack(self.FILE_FMT, self.scale, self.ratio,
+                 self.initial_capacity, self.error_rate), self.filters)
 
     @classmethod
-    def from_str(cls, s):
+    def from_bytes(cls, b):
+        """Rebuild a ScalableBloomFilter from a to_bytes() frame."""
+        fields, filters = _frames_from_bytes(b, cls.FILE_FMT)
         filter = cls(1)
-        values = s.split(",")
-        filter._setup(int(values[0]), float(values[1]), int(values[2]), float(values[3]))
-        if values[4]:
-            filters = []
-            for item in values[4].split("|"):
-                filters.append(BloomFilter.from_str(item))
+        filter._setup(*fields)
         filter.filters = filters
+        filter._tail = filters[-1] if filters else None
         return filter
 
+    def __str__(self):
+        return b85encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def from_str(cls, s):
+        return cls.from_bytes(b85decode(s))
+
     def tofile(self, f):
         """Serialize this ScalableBloomFilter into the file-object
         `f'."""
@@ -494,6 +951,7 @@ class ScalableBloomFilter(object):
                 filter.filters.append(BloomFilter.fromfile(f, fl))
         else:
             filter.filters = []
+        filter._tail = filter.filters[-1] if filter.filters else None
 
         return filter
 
@@ -537,6 +995,7 @@ class DynamicBloomFilter(object):
             raise ValueError("error_rate must be a decimal greater than 0.")
         self._setup(base_capacity, max_capacity, error_rate)
         self.filters = []
+        self._tail = None
 
     def _setup(self, base_capacity, max_capacity, error_rate):
         self.individual_error_rate = 1 - math.exp(math.log(1 - error_rate)/math.ceil(max_capacity/base_capacity))
@@ -554,8 +1013,14 @@ class DynamicBloomFilter(object):
         True
 
         """
+        hashes = None
         for f in reversed(self.filters):
-            if key in f:
+            if f._shares_hashes:
+                if hashes is None:
+                    hashes = _double_hash(key)
+                if f._contains_hashes(*hashes):
+                    return True
+            elif key in f:
                 return True
         return False
 
@@ -571,21 +1036,24 @@ class DynamicBloomFilter(object):
         True
 
         """
-        if key in self:
-            return True
-        if not self.filters:
+        # hash the key once and share the pair across every inner filter
+        hashes = _double_hash(key)
+        for f in reversed(self.filters):
+            if (f._contains_hashes(*hashes) if f._shares_hashes
+                    else key in f):
+                return True
+        filter = self._tail
+        if filter is None or filter.count >= filter.capacity:
             filter = BloomFilter(
                 capacity=self.base_capacity,
                 error_rate=self.individual_error_rate)
             self.filters.append(filter)
+            self._tail = filter
+        if filter._shares_hashes:
+            filter._add_hashes(*hashes)
+            filter.count += 1
         else:
-            filter = self.filters[-1]
-            if filter.count >= filter.capacity:
-                filter = BloomFilter(
-                    capacity=self.base_capacity,
-                    error_rate=self.individual_error_rate)
-                self.filters.append(filter)
-        filter.add(key, skip_check=True)
+            filter.add(key, skip_check=True)
         return False
 
     def union(self, other):
@@ -602,31 +1070,43 @@ class DynamicBloomFilter(object):
         new_bloom = DynamicBloomFilter(base_capacity=self.base_capacity,
                                        max_capacity=self.max_capacity,
                                        error_rate=self.max_error_rate)
-        my_filters = self.filters
-        other_filters = []
-        for filter in other.filters:
-            other_filters.append(filter.copy())
-        for i in range(0, len(my_filters)):
-            found_union_mate = False
-            for j in range(0, len(other_filters)):
-                other_filter_index = len(other_filters) - 1 - j
-                union_filter = (my_filters[i] | other_filters[other_filter_index])
-                if(union_filter.count < self.base_capacity):
-                    other_filters[other_filter_index] = union_filter
-                    found_union_mate = True
-                    break
-            if(not found_union_mate):
-                other_filters.append(my_filters[i])
-        new_bloom.filters = other_filters
+        # Greedy match: keep the candidates sorted by load and pair each
+        # of our filters with the fullest one that still has room, so a
+        # single OR per filter is attempted instead of trying every pair.
+        merged = sorted((filter.copy() for filter in other.filters),
+                        key=lambda f: f.count)
+        loads = [filter.count for filter in merged]
+        for my_filter in self.filters:
+            j = bisect.bisect_right(
+                loads, self.base_capacity - my_filter.count) - 1
+            union_filter = None
+            if j >= 0:
+                union_filter = my_filter | merged[j]
+            if union_filter is not None and \
+                    union_filter.count < self.base_capacity:
+                del merged[j], loads[j]
+            else:
+                # counts are not additive, so the merge can still come
+                # out too full; keep our filter as its own member then
+                union_filter = my_filter
+            k = bisect.bisect_left(loads, union_filter.count)
+            merged.insert(k, union_filter)
+            loads.insert(k, union_filter.count)
+        new_bloom.filters = merged
+        new_bloom._tail = merged[-1] if merged else None
         return new_bloom
 
     def __or__(self, other):
         return self.union(other)
 
     def intersection(self, other):
-        """ Calculates the intersection of the bitarrays of the base bloomfilters and returns
-        a new bloom filter object.  In principal using this should keep the error_rate and the number of
-        filters constant"""
+        """ Calculates the intersection of the two filters: membership in
+        the result means (x in self) AND (x in other), up to the usual
+        false-positive rate. Each pair of base filters is intersected
+        bitwise and kept as its own member -- ORing the pair results
+        together would saturate the merged filter and inflate the error
+        rate badly -- so the result can have up to
+        len(self.filters) * len(other.filters) members"""
         if self.base_capacity != other.base_capacity or \
            self.individual_error_rate != other.individual_error_rate:
             raise ValueError("Intersecting dynamic filters requires both filters to \
@@ -636,10 +1116,9 @@ class DynamicBloomFilter(object):
                                        max_capacity=self.max_capacity,
                                        error_rate=self.max_error_rate)
         for bloom_filter in self.filters:
-            bloom = BloomFilter(capacity=self.base_capacity, error_rate=self.individual_error_rate)
             for other_filter in other.filters:
-                bloom = bloom or (bloom_filter and other_filter)
-            new_bloom.filters.append(bloom)
+                new_bloom.filters.append(bloom_filter & other_filter)
+        new_bloom._tail = new_bloom.filters[-1] if new_bloom.filters else None
         return new_bloom
 
     def __and__(self, other):
@@ -658,23 +1137,29 @@ class DynamicBloomFilter(object):
         """Returns the total number of elements stored in this DBF"""
         return sum(f.count for f in self.filters)
 
-    def __str__(self):
-        return ",".join([str(self.base_capacity), str(self.max_capacity),
-                        str(self.max_error_rate),
-                        "|".join([str(filter) for filter in self.filters])])
+    def to_bytes(self):
+        """Serialize this DynamicBloomFilter as one binary frame."""
+        return _frames_to_bytes(
+            pack(self.FILE_FMT, self.base_capacity, self.max_capacity,
+                 self.max_error_rate), self.filters)
 
     @classmethod
-    def from_str(cls, s):
+    def from_bytes(cls, b):
+        """Rebuild a DynamicBloomFilter from a to_bytes() frame."""
+        fields, filters = _frames_from_bytes(b, cls.FILE_FMT)
         filter = cls(1)
-        values = s.split(",")
-        filter._setup(int(values[0]), int(values[1]), float(values[2]))
-        if values[3]:
-            filters = []
-            for item in values[3].split("|"):
-                filters.append(BloomFilter.from_str(item))
+        filter._setup(*fields)
         filter.filters = filters
+        filter._tail = filters[-1] if filters else None
         return filter
 
+    def __str__(self):
+        return b85encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def from_str(cls, s):
+        return cls.from_bytes(b85decode(s))
+
     def tofile(self, f):
         """Serialize this DynamicBloomFilter into the file-object
         `f'."""
@@ -713,6 +1198,7 @@ class DynamicBloomFilter(object):
                 filter.filters.append(BloomFilter.fromfile(f, fl))
         else:
             filter.filters = []
+        filter._tail = filter.filters[-1] if filter.filters else None
 
         return filter
 
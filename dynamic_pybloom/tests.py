@@ -75,6 +75,22 @@ class TestUnionIntersection(unittest.TestCase):
         for char in chars[int(len(chars) / 2):]:
             self.assertTrue(char not in new_bloom)
 
+    def test_dynamic_intersection_multiple_filters(self):
+        bloom_one = DynamicBloomFilter(base_capacity=20, max_capacity=200)
+        bloom_two = DynamicBloomFilter(base_capacity=20, max_capacity=200)
+        for i in range_fn(0, 60):
+            bloom_one.add(i)
+        for i in range_fn(40, 100):
+            bloom_two.add(i)
+        self.assertTrue(len(bloom_one.filters) > 1)
+        new_bloom = bloom_one.intersection(bloom_two)
+        for i in range_fn(40, 60):
+            self.assertTrue(i in new_bloom)
+        for i in range_fn(0, 40):
+            self.assertTrue(i not in new_bloom)
+        for i in range_fn(60, 100):
+            self.assertTrue(i not in new_bloom)
+
     def test_intersection_capacity_fail(self):
         bloom_one = BloomFilter(1000, 0.001)
         bloom_two = BloomFilter(100, 0.001)
@@ -122,6 +138,44 @@ class TestUnionIntersection(unittest.TestCase):
         self.assertRaises(ValueError, _run)
 
 
+class TestBatchOperations(unittest.TestCase):
+    def test_add_many_contains_many(self):
+        bloom = BloomFilter(1000, 0.001)
+        keys = [i for i in range_fn(0, 500)]
+        found = bloom.add_many(keys)
+        self.assertFalse(any(found))
+        self.assertEqual(bloom.count, len(keys))
+        self.assertTrue(all(bloom.contains_many(keys)))
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertTrue(all(bloom.add_many(keys)))
+        absent = [i for i in range_fn(10000, 11000)]
+        false_positives = sum(bool(hit)
+                              for hit in bloom.contains_many(absent))
+        self.assertTrue(false_positives < 20)
+
+    def test_scalar_fallback_matches_numpy_path(self):
+        fast = BloomFilter(1000, 0.001)
+        slow = BloomFilter(1000, 0.001)
+        slow._use_numpy = False
+        slow._use_kernels = False
+        keys = [i for i in range_fn(0, 500)]
+        self.assertFalse(any(fast.add_many(keys)))
+        self.assertFalse(any(slow.add_many(keys)))
+        self.assertEqual(fast.bitarray, slow.bitarray)
+        self.assertEqual(fast.count, slow.count)
+        probes = keys + [i for i in range_fn(10000, 10500)]
+        self.assertEqual([bool(hit) for hit in fast.contains_many(probes)],
+                         slow.contains_many(probes))
+
+    def test_scalable_add_many_grows_filters(self):
+        sbf = ScalableBloomFilter(initial_capacity=20, error_rate=0.001)
+        keys = [i for i in range_fn(0, 200)]
+        sbf.add_many(keys)
+        self.assertTrue(len(sbf.filters) > 1)
+        self.assertTrue(all(key in sbf for key in keys))
+        self.assertTrue(len(sbf) <= len(keys))
+
+
 class Serialization(unittest.TestCase):
     SIZE = 12345
     EXPECTED = set([random.randint(0, 10000100) for _ in range_fn(SIZE)])
@@ -154,6 +208,49 @@ class Serialization(unittest.TestCase):
                 del(filter)
                 stream.close()
 
+    def test_to_bytes_roundtrip(self):
+        for klass, args in [(BloomFilter, (self.SIZE,)),
+                            (ScalableBloomFilter, ()),
+                            (DynamicBloomFilter, ())]:
+            filter = klass(*args)
+            for item in self.EXPECTED:
+                filter.add(item)
+
+            payload = filter.to_bytes()
+            del filter
+            filter = klass.from_bytes(payload)
+            for item in self.EXPECTED:
+                self.assertTrue(item in filter)
+            del(filter)
+
+    def test_to_bytes_roundtrip_empty(self):
+        for klass in [ScalableBloomFilter, DynamicBloomFilter]:
+            filter = klass.from_bytes(klass().to_bytes())
+            self.assertEqual(len(filter.filters), 0)
+            self.assertTrue("hello" not in filter)
+            filter.add("hello")
+            self.assertTrue("hello" in filter)
+
+    def test_security_filter_roundtrip(self):
+        filter = BloomFilter(100, 0.001, security=True)
+        filter.add("hello")
+
+        restored = BloomFilter.from_bytes(filter.to_bytes())
+        self.assertTrue(restored.security)
+        self.assertTrue("hello" in restored)
+
+        restored = BloomFilter.from_str(str(filter))
+        self.assertTrue(restored.security)
+        self.assertTrue("hello" in restored)
+
+        f = tempfile.TemporaryFile()
+        filter.tofile(f)
+        f.seek(0)
+        restored = BloomFilter.fromfile(f)
+        self.assertTrue(restored.security)
+        self.assertTrue("hello" in restored)
+
+
 class Stringification(unittest.TestCase):
     SIZE = 12345
     EXPECTED = set([random.randint(0, 10000100) for _ in range_fn(SIZE)])